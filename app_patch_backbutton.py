@@ -1,54 +1,136 @@
 
 # Tender Management UI (Streamlit)
 import streamlit as st
-import json, os
+import os
+import html
+import shutil
+import stat
+import tempfile
+import hashlib
+import sqlite3
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
 import pandas as pd
+import db
 
-DATA_PATH = os.path.join('data', 'tenders.json')
+DATA_PATH = db.DB_PATH
 ATTACH_DIR = os.path.join('data', 'attachments')
+PAGES = ('Opportunities', 'New Opportunity', 'Opportunity Detail', 'Submit Tender')
+PAGE_INDEX = {p: i for i, p in enumerate(PAGES)}
 
 st.set_page_config(page_title='Tender Management', layout='wide')
 
 # ------------------ Styles ------------------
+@st.cache_data(show_spinner=False)
+def _load_css(path, mtime):
+    # mtime is only part of the cache key so edits to the stylesheet are picked up
+    if not os.path.exists(path):
+        return ""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
 css_path = os.path.join('styles.css')
-if os.path.exists(css_path):
-    with open(css_path, 'r', encoding='utf-8') as f:
-        st.markdown("<style>" + f.read() + "</style>", unsafe_allow_html=True)
+css = _load_css(css_path, os.path.getmtime(css_path) if os.path.exists(css_path) else 0)
+if css:
+    st.markdown("<style>" + css + "</style>", unsafe_allow_html=True)
 
 # ------------------ Utilities ------------------
-def load_data():
-    if not os.path.exists(DATA_PATH):
-        return {"opportunities": []}
-    # Guard against empty / corrupted JSON
-    try:
-        with open(DATA_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        if not isinstance(data, dict) or 'opportunities' not in data:
-            return {"opportunities": []}
-        return data
-    except Exception:
-        return {"opportunities": []}
-
-def save_data(data):
-    with open(DATA_PATH, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
-
-def get_by_id(data, opp_id):
-    for opp in data.get('opportunities', []):
-        if opp.get('id') == opp_id:
-            return opp
-    return None
-
-def next_id(data):
-    ids = []
+def _current_umask():
+    # The umask can only be read by setting it, so put it straight back
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+def _db_mtime():
+    return os.path.getmtime(DATA_PATH) if os.path.exists(DATA_PATH) else 0
+
+def load_data(path=DATA_PATH):
+    # Only the list-view summaries are loaded; full records are read per id.
+    # Errors propagate: an empty result would be cached and shared by every session.
+    return {"opportunities": db.fetch_summaries(db.get_conn(path))}
+
+def _group_by_stage(data):
+    opps = data.get('opportunities', [])
+    idx = {}
+    for o in opps:
+        idx.setdefault(db.stage_key(o.get('stage')), []).append(o)
+    # Aliases go in after grouping: a blank stage must not alias the list being iterated
+    idx['all'] = idx[''] = list(opps)
+    return idx
+
+def _max_seq(data):
+    seqs = []
     for o in data.get('opportunities', []):
+        suffix = str(o.get('id', '')).rsplit('-', 1)[-1]
+        if suffix.isdigit():
+            seqs.append(int(suffix))
+    return max(seqs, default=0)
+
+def _hash_payload(payload):
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _build_store(path, mtime):
+    # Shared by every session of this server process and treated as read-only;
+    # mtime is only part of the key so writes from anywhere rebuild it
+    data = load_data(path)
+    return {
+        'data': data,
+        'by_id': {o['id']: o for o in data['opportunities']},
+        'by_stage': _group_by_stage(data),
+        'max_seq': _max_seq(data),
+        'hash': _hash_payload(orjson.dumps(data['opportunities'])),
+    }
+
+def get_store():
+    return _build_store(DATA_PATH, _db_mtime())
+
+# Saves in this process clear it; the mtime key catches writes from other processes.
+# Bounded: the mtime key means every save leaves the previous entries behind
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_opp_cached(path, mtime, opp_id):
+    return db.fetch_by_id(db.get_conn(path), opp_id)
+
+def save_opportunity(opp, new=False):
+    """Persist a single opportunity; the shared store is rebuilt on next access.
+
+    With new=True the row is inserted, so an id collision raises instead of overwriting.
+    """
+    row = (opp['id'], db.stage_key(opp.get('stage')), orjson.dumps(opp).decode())
+    if new:
         try:
-            ids.append(int(str(o.get('id', '')).split('-')[-1]))
-        except Exception:
-            pass
-    nxt = max(ids) + 1 if ids else 1
-    return f"OPP-{nxt:04d}"
+            db.insert(db.get_conn(DATA_PATH), row)
+        finally:
+            # On a collision the caches are stale too; rebuild them either way
+            _invalidate_caches()
+    # The upsert skips rows whose stored payload is unchanged
+    elif db.upsert_many(db.get_conn(DATA_PATH), [row]):
+        _invalidate_caches()
+
+def create_opportunity(opp):
+    """Insert a new opportunity, retrying once with a fresh id if another session took it."""
+    try:
+        save_opportunity(opp, new=True)
+    except sqlite3.IntegrityError:
+        # save_opportunity() already cleared the store, so next_id() sees the other record
+        opp['id'] = next_id(get_store())
+        save_opportunity(opp, new=True)
+
+def _invalidate_caches():
+    # Cleared explicitly: two saves inside the filesystem's mtime resolution
+    # would otherwise be served the pre-save copies
+    _build_store.clear()
+    _load_opp_cached.clear()
+
+def get_by_id(store, opp_id):
+    """Full record for opp_id, read on demand; a fresh copy that can be edited and saved."""
+    if opp_id not in store['by_id']:
+        return None
+    return _load_opp_cached(DATA_PATH, _db_mtime(), opp_id)
+
+def next_id(store):
+    return f"OPP-{store['max_seq'] + 1:04d}"
 
 def money(v):
     try:
@@ -56,36 +138,103 @@ def money(v):
     except Exception:
         return "-"
 
-def filter_opportunities_by_stage(data, stage):
-    stage = (stage or '').strip()
-    if stage.lower() == 'all' or stage == '':
-        return data.get('opportunities', [])
-    return [
-        o for o in data.get('opportunities', [])
-        if str(o.get('stage', '')).strip().lower() == stage.lower()
-    ]
+def filter_opportunities_by_stage(store, stage):
+    return store['by_stage'].get(db.stage_key(stage), [])
+
+OPP_LIST_COLS = ['id', 'name', 'account_name', 'stage', 'probability', 'expected_revenue', 'close_date']
+STAGES = ['All', 'Qualification', 'Proposal', 'Negotiation', 'Submitted', 'Closed Won', 'Closed Lost']
+
+# Bounded to about two data versions per stage; older hashes are never requested again
+@st.cache_data(show_spinner=False, max_entries=2 * len(STAGES))
+def _build_view_df(_store, stage, data_hash):
+    # _store is not hashed by Streamlit; data_hash stands in for it, so any save busts the cache
+    df = pd.DataFrame(filter_opportunities_by_stage(_store, stage))
+    if df.empty:
+        return df
+    existing_cols = [c for c in OPP_LIST_COLS if c in df.columns]
+    df_view = df[existing_cols].copy()
+    if 'expected_revenue' in df_view.columns:
+        # Same output as money(): non-numeric values become "-"
+        revenue = pd.to_numeric(df_view['expected_revenue'], errors='coerce')
+        df_view['expected_revenue'] = revenue.map("${:,.2f}".format).where(revenue.notna(), "-")
+    return df_view
+
+# ------------------ Cached HTML ------------------
+# User-entered text is escaped here; callers pass plain hashable values so
+# Streamlit can key the cache on them and skip rebuilding unchanged strings.
+# Keys are content, so every edit adds an entry; the caps keep them from piling up.
+RENDER_CACHE_ENTRIES = 64
+
+@st.cache_data(show_spinner=False, max_entries=RENDER_CACHE_ENTRIES)
+def _render_header_html(name, account_name):
+    return f"""
+        <div class="opportunity-header">
+            <div class="opportunity-avatar">{html.escape(name[:2].upper())}</div>
+            <div>
+                <div class="opportunity-title">{html.escape(name)}</div>
+                <div class="opportunity-sub">{html.escape(account_name)}</div>
+            </div>
+            <div style="flex:1"></div>
+            <div class="action-bar">
+                <button class="action-btn">+ Follow</button>
+                <button class="action-btn">New Case</button>
+                <button class="action-btn">New Note</button>
+                <button class="action-btn">Clone</button>
+            </div>
+        </div>
+        """
+
+def _product_rows(products):
+    """(name, quantity, price, date) tuples for the given product dicts."""
+    return tuple(
+        (str(p.get('name', '')), p.get('quantity', 0) or 0, p.get('price', 0.0) or 0.0, str(p.get('date', '')))
+        for p in products or []
+    )
+
+@st.cache_data(show_spinner=False, max_entries=RENDER_CACHE_ENTRIES)
+def _render_products_html(product_rows):
+    return "".join(
+        f"<div class='product-item'>"
+        f"<div class='product-header'>"
+        f"<div class='product-name'>{html.escape(pname)}</div>"
+        f"<div class='product-meta'>Qty: {int(pqty):,} • Price: ${float(pprice):.2f} • Date: {html.escape(pdate)}</div>"
+        f"</div></div>"
+        for pname, pqty, pprice, pdate in product_rows
+    )
+
+@st.cache_data(show_spinner=False, max_entries=RENDER_CACHE_ENTRIES)
+def _products_table_html(product_rows):
+    if not product_rows:
+        return "<i>No products</i>"
+    rows = "".join(
+        f"<tr><td>{html.escape(pname)}</td><td>{html.escape(str(pqty))}</td>"
+        f"<td>${float(pprice):.2f}</td><td>{html.escape(pdate)}</td></tr>"
+        for pname, pqty, pprice, pdate in product_rows
+    )
+    return (
+        "<table class='prod-table'><thead><tr><th>Name</th><th>Qty</th><th>Price</th><th>Date</th></tr></thead>"
+        f"<tbody>{rows}</tbody></table>"
+    )
+
+@st.cache_data(show_spinner=False, max_entries=RENDER_CACHE_ENTRIES)
+def _render_attachments_html(attachment_rows):
+    return "".join(
+        f"<div class='attachment-row'><div>📎 {html.escape(aname)}</div>"
+        f"<div class='product-meta'>{html.escape(awhen)} • {html.escape(asize)} bytes</div></div>"
+        for aname, awhen, asize in attachment_rows
+    )
 
 # ------------------ Safe helpers (versions) ------------------
-def safe_rerun():
-    if hasattr(st, "rerun"):
-        st.rerun()
-    elif hasattr(st, "experimental_rerun"):
-        st.experimental_rerun()
-
-def safe_set_query_params(**kwargs):
-    # Always keep URL in sync with current state
-    if hasattr(st, "query_params"):
-        st.query_params.update(kwargs)
-    elif hasattr(st, "experimental_set_query_params"):
-        st.experimental_set_query_params(**kwargs)
-
-def safe_get_query_params():
-    if hasattr(st, "query_params"):
-        return dict(st.query_params)
-    elif hasattr(st, "experimental_get_query_params"):
-        xp = st.experimental_get_query_params()
-        return {k: (v[0] if isinstance(v, list) and v else None) for k, v in xp.items()}
-    return {}
+from compat import safe_rerun, safe_fragment, safe_set_query_params, safe_get_query_params
+
+def queue_qp(**kwargs):
+    """Record URL state to push; flush_qp() applies it in a single update."""
+    st.session_state.setdefault('_qp_pending', {}).update(kwargs)
+
+def flush_qp():
+    pending = st.session_state.pop('_qp_pending', None)
+    if pending:
+        safe_set_query_params(**pending)
 
 # ------------------ Navigation history & Back button ------------------
 def push_nav(page_name: str):
@@ -106,17 +255,16 @@ def back_button():
             hist.pop()
             target = hist[-1]
             st.session_state['nav_target'] = target
-            safe_set_query_params(page=target, id=st.session_state.get('current_id'))
+            queue_qp(page=target, id=st.session_state.get('current_id'))
             safe_rerun()
 
     st.button('← Back', disabled=disabled, on_click=_go_back)
 
 # ------------------ Seed state ------------------
-if 'data' not in st.session_state:
-    st.session_state.data = load_data()
+store = get_store()
 
-if 'current_id' not in st.session_state and st.session_state.data.get('opportunities'):
-    st.session_state.current_id = st.session_state.data['opportunities'][0]['id']
+if 'current_id' not in st.session_state and store['data'].get('opportunities'):
+    st.session_state.current_id = store['data']['opportunities'][0]['id']
 
 # Current page (radio) lives in session_state['nav']
 if 'nav' not in st.session_state:
@@ -135,15 +283,15 @@ if 'nav_target' in st.session_state:
     st.session_state._qp_consumed = False
 
 # Deep-link hydration (apply only once per session, or after explicit intent above)
-qp = safe_get_query_params()
+# URL updates queued before a rerun have not been pushed yet, so they win over the live params
+qp = {**safe_get_query_params(), **st.session_state.get('_qp_pending', {})}
 qp_id = qp.get('id')
 qp_page = qp.get('page')
-valid_pages = ['Opportunities', 'New Opportunity', 'Opportunity Detail', 'Submit Tender']
 
 if not st.session_state._qp_consumed:
-    if qp_id and any(o['id'] == qp_id for o in st.session_state.data.get('opportunities', [])):
+    if qp_id and qp_id in store['by_id']:
         st.session_state.current_id = qp_id
-    if qp_page in valid_pages:
+    if qp_page in PAGE_INDEX:
         st.session_state['nav'] = qp_page
     # Mark hydration as consumed to avoid overriding user choices on subsequent runs
     st.session_state._qp_consumed = True
@@ -152,13 +300,13 @@ if not st.session_state._qp_consumed:
 st.sidebar.title('Tender Management')
 page = st.sidebar.radio(
     'Navigate',
-    ['Opportunities', 'New Opportunity', 'Opportunity Detail', 'Submit Tender'],
-    index=['Opportunities', 'New Opportunity', 'Opportunity Detail', 'Submit Tender'].index(st.session_state['nav']),
+    PAGES,
+    index=PAGE_INDEX[st.session_state['nav']],
     key='nav'
 )
 
-# ✅ Keep query params in sync with current selection
-safe_set_query_params(page=page, id=st.session_state.get('current_id'))
+# ✅ Keep query params in sync with current selection (pushed once, at the end of the run)
+queue_qp(page=page, id=st.session_state.get('current_id'))
 
 # Push current page to history (once per run, no duplicate consecutive entries)
 push_nav(page)
@@ -167,41 +315,26 @@ st.sidebar.markdown('---')
 st.sidebar.caption('Quick Filters')
 selected_stage = st.sidebar.selectbox(
     'Stage',
-    options=['All', 'Qualification', 'Proposal', 'Negotiation', 'Submitted', 'Closed Won', 'Closed Lost'],
+    options=STAGES,
     index=0
 )
 
-# ------------------ Pages ------------------
-if page == 'Opportunities':
-    # Back button at the top
-    back_button()
+# ------------------ Page fragments ------------------
+@safe_fragment
+def render_opportunities(selected_stage):
+    """Opportunities table + actions; selection changes rerun only this fragment."""
     st.markdown('<div class="card"><div class="card-title">Opportunities</div>', unsafe_allow_html=True)
 
-    filtered_opps = filter_opportunities_by_stage(st.session_state.data, selected_stage)
-    df = pd.DataFrame(filtered_opps)
-
-    if not df.empty:
-        base_cols = ['id', 'name', 'account_name', 'stage', 'probability', 'expected_revenue', 'close_date']
-        existing_cols = [c for c in base_cols if c in df.columns]
-        df_view = df[existing_cols].copy()
-        if 'expected_revenue' in df_view.columns:
-            df_view['expected_revenue'] = df_view['expected_revenue'].apply(money)
+    # Fetched here rather than closed over, so fragment reruns see the latest store
+    store = get_store()
+    df_view = _build_view_df(store, selected_stage, store['hash'])
 
+    if not df_view.empty:
         # ---------- Radio-like single selection in FIRST column ----------
-        ids = df_view['id'].tolist()
-        current_id = st.session_state.get('current_id', '')
-        if '_selected_map' not in st.session_state:
-            st.session_state._selected_map = {rid: (rid == current_id) for rid in ids}
-        else:
-            # keep only current table ids
-            for k in list(st.session_state._selected_map.keys()):
-                if k not in ids:
-                    st.session_state._selected_map.pop(k)
-            for rid in ids:
-                st.session_state._selected_map.setdefault(rid, rid == current_id)
-
-        prev_map = dict(st.session_state._selected_map)
-        df_view.insert(0, '_selected', df_view['id'].map(lambda rid: bool(st.session_state._selected_map.get(rid, False))))
+        # The checkbox column is derived from current_id, so it always matches what Open Detail opens
+        prev_id = st.session_state.get('current_id')
+        ids = set(df_view['id'])
+        df_view.insert(0, '_selected', df_view['id'] == prev_id)
 
         edited = st.data_editor(
             df_view,
@@ -216,47 +349,31 @@ if page == 'Opportunities':
             }
         )
 
-        edited_map = {row_id: bool(edited.loc[edited['id'] == row_id, '_selected'].values[0]) for row_id in ids}
-        changed_to_true = [rid for rid in ids if edited_map[rid] and not prev_map.get(rid, False)]
-
-        selected_id = None
-        if changed_to_true:
-            # last click wins
-            selected_id = changed_to_true[-1]
-            st.session_state._selected_map = {rid: (rid == selected_id) for rid in ids}
+        selected_now = edited.loc[edited['_selected'].astype(bool), 'id'].tolist()
+        newly_selected = [rid for rid in selected_now if rid != prev_id]
+        if newly_selected:
+            # last click wins; rerun so the previous tick is cleared
+            selected_id = newly_selected[-1]
             st.session_state.current_id = selected_id
             # Sync URL
-            safe_set_query_params(page='Opportunities', id=selected_id)
-            safe_rerun()
-        else:
-            selected_ids = [rid for rid in ids if edited_map[rid]]
-            if len(selected_ids) == 0:
-                selected_id = None
-                st.session_state._selected_map = {rid: False for rid in ids}
-            elif len(selected_ids) == 1:
-                selected_id = selected_ids[0]
-                st.session_state._selected_map = {rid: (rid == selected_id) for rid in ids}
-                st.session_state.current_id = selected_id
-                safe_set_query_params(page='Opportunities', id=selected_id)
-            else:
-                # multiple checked → keep the last to emulate radio behavior
-                selected_id = selected_ids[-1]
-                st.session_state._selected_map = {rid: (rid == selected_id) for rid in ids}
-                st.session_state.current_id = selected_id
-                safe_set_query_params(page='Opportunities', id=selected_id)
-                safe_rerun()
+            queue_qp(page='Opportunities', id=selected_id)
+            safe_rerun(scope='fragment')
+        elif prev_id in ids and not selected_now:
+            # The selected row was unticked: nothing is selected any more
+            st.session_state.current_id = None
+            queue_qp(page='Opportunities', id=None)
 
         # Actions
         col1, col2 = st.columns([1, 1])
 
-        def _go_detail():
-            if st.session_state.get('current_id'):
-                st.session_state['nav_target'] = 'Opportunity Detail'
-                safe_set_query_params(page='Opportunity Detail', id=st.session_state['current_id'])
-                safe_rerun()
-
         with col1:
-            st.button('Open Detail', type='primary', disabled=(st.session_state.get('current_id') is None), on_click=_go_detail)
+            # Not an on_click callback: a rerun from a callback is a no-op, and inside the
+            # fragment the page switch needs a full app rerun to be picked up
+            if st.button('Open Detail', type='primary', disabled=(st.session_state.get('current_id') is None)):
+                if st.session_state.get('current_id'):
+                    st.session_state['nav_target'] = 'Opportunity Detail'
+                    queue_qp(page='Opportunity Detail', id=st.session_state['current_id'])
+                    safe_rerun()
         with col2:
             st.button('Clone Selected', help='Create a copy of the selected opportunity')
 
@@ -264,6 +381,14 @@ if page == 'Opportunities':
         st.info('No opportunities yet. Create one using "New Opportunity".')
 
     st.markdown('</div>', unsafe_allow_html=True)
+    # Fragment-only reruns never reach the end of the script
+    flush_qp()
+
+# ------------------ Pages ------------------
+if page == 'Opportunities':
+    # Back button at the top
+    back_button()
+    render_opportunities(selected_stage)
 
 elif page == 'New Opportunity':
     # Back button at the top
@@ -291,7 +416,7 @@ elif page == 'New Opportunity':
         submitted = st.form_submit_button('Create', type='primary')
         if submitted:
             opp = {
-                'id': next_id(st.session_state.data),
+                'id': next_id(store),
                 'name': name,
                 'account_name': account,
                 'private': private,
@@ -313,14 +438,17 @@ elif page == 'New Opportunity':
                 'products': [],
                 'attachments': []
             }
-            st.session_state.data['opportunities'].append(opp)
-            save_data(st.session_state.data)
-            st.session_state.current_id = opp['id']
-            # Navigate to detail of the new record
-            st.session_state['nav_target'] = 'Opportunity Detail'
-            safe_set_query_params(page='Opportunity Detail', id=opp['id'])
-            st.success(f"Opportunity {opp['id']} created.")
-            safe_rerun()
+            try:
+                create_opportunity(opp)
+            except sqlite3.IntegrityError:
+                st.error(f"Opportunity {opp['id']} already exists (created elsewhere). Please submit again.")
+            else:
+                st.session_state.current_id = opp['id']
+                # Navigate to detail of the new record
+                st.session_state['nav_target'] = 'Opportunity Detail'
+                queue_qp(page='Opportunity Detail', id=opp['id'])
+                st.success(f"Opportunity {opp['id']} created.")
+                safe_rerun()
     st.markdown('</div>', unsafe_allow_html=True)
 
 elif page == 'Opportunity Detail':
@@ -328,7 +456,7 @@ elif page == 'Opportunity Detail':
     back_button()
 
     current_id = st.session_state.get('current_id')
-    opp = get_by_id(st.session_state.data, current_id) if current_id else None
+    opp = get_by_id(store, current_id) if current_id else None
 
     if not opp:
         st.warning("No selected tender or it no longer exists. Please select one from **Opportunities**.")
@@ -337,23 +465,7 @@ elif page == 'Opportunity Detail':
             v = d.get(k, default)
             return v
 
-        avatar_letters = gv(opp, 'name', '')[:2].upper()
-        header_html = f"""
-        <div class="opportunity-header">
-            <div class="opportunity-avatar">{avatar_letters}</div>
-            <div>
-                <div class="opportunity-title">{gv(opp, 'name', '')}</div>
-                <div class="opportunity-sub">{gv(opp, 'account_name', '')}</div>
-            </div>
-            <div style="flex:1"></div>
-            <div class="action-bar">
-                <button class="action-btn">+ Follow</button>
-                <button class="action-btn">New Case</button>
-                <button class="action-btn">New Note</button>
-                <button class="action-btn">Clone</button>
-            </div>
-        </div>
-        """
+        header_html = _render_header_html(str(gv(opp, 'name', '')), str(gv(opp, 'account_name', '')))
         st.markdown(header_html, unsafe_allow_html=True)
 
         left, right = st.columns([2, 1])
@@ -387,20 +499,9 @@ elif page == 'Opportunity Detail':
         # RIGHT: Products + Notes + Navigation to Submit Tender
         with right:
             st.markdown('<div class="card"><div class="card-title">Products</div>', unsafe_allow_html=True)
-            products = opp.get('products', []) or []
-            for p in products:
-                pname = p.get('name', '')
-                pqty = p.get('quantity', 0) or 0
-                pprice = p.get('price', 0.0) or 0.0
-                pdate = p.get('date', '')
-                st.markdown(
-                    f"<div class='product-item'>"
-                    f"<div class='product-header'>"
-                    f"<div class='product-name'>{pname}</div>"
-                    f"<div class='product-meta'>Qty: {int(pqty):,} • Price: ${float(pprice):.2f} • Date: {pdate}</div>"
-                    f"</div></div>",
-                    unsafe_allow_html=True
-                )
+            products_html = _render_products_html(_product_rows(opp.get('products')))
+            if products_html:
+                st.markdown(products_html, unsafe_allow_html=True)
 
             with st.expander('Add Product'):
                 pname = st.text_input('Product Name', key='prod_name')
@@ -415,7 +516,7 @@ elif page == 'Opportunity Detail':
                         'price': float(pprice),
                         'date': pdate.isoformat()
                     })
-                    save_data(st.session_state.data)
+                    save_opportunity(opp)
                     safe_rerun()
 
             st.markdown('<div class="helper">View All</div>', unsafe_allow_html=True)
@@ -423,38 +524,65 @@ elif page == 'Opportunity Detail':
 
             st.markdown('<div class="card"><div class="card-title">Notes &amp; Attachments</div>', unsafe_allow_html=True)
             uploaded = st.file_uploader('Upload Files', accept_multiple_files=True)
-            if uploaded:
+            # Files stay in the uploader across reruns; only persist ones not seen before
+            persisted = st.session_state.setdefault('_persisted_uploads', set())
+            new_uploads = [
+                up for up in uploaded or []
+                if up and up.name and getattr(up, 'file_id', getattr(up, 'id', None)) not in persisted
+            ]
+            if new_uploads:
                 os.makedirs(ATTACH_DIR, exist_ok=True)  # ensure directory exists
-                for up in uploaded:
-                    if not up or not up.name:
-                        continue
+                now_iso = datetime.now().isoformat(timespec='seconds')
+
+                # mkstemp creates 0600 files; give uploads the mode a plain open() would
+                new_file_mode = 0o666 & ~_current_umask()
+
+                def _persist(up):
                     path = os.path.join(ATTACH_DIR, up.name)
-                    with open(path, 'wb') as f:
-                        f.write(up.getbuffer())
-                    opp.setdefault('attachments', [])
-                    opp['attachments'].append({
+                    # Write to a unique temp file beside the target and swap in, so a crash
+                    # or a concurrent upload of the same name never leaves a torn file
+                    fd, tmp = tempfile.mkstemp(dir=ATTACH_DIR, suffix='.tmp')
+                    try:
+                        with os.fdopen(fd, 'wb') as f:
+                            # Stream in 1 MiB chunks rather than materialising the whole upload
+                            up.seek(0)
+                            shutil.copyfileobj(up, f, length=1024 * 1024)
+                            f.flush()
+                            os.fsync(f.fileno())
+                            size = f.tell()
+                        mode = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else new_file_mode
+                        os.chmod(tmp, mode)
+                        os.replace(tmp, path)
+                    except BaseException:
+                        if os.path.exists(tmp):
+                            os.remove(tmp)
+                        raise
+                    return {
                         'name': up.name,
-                        'size': getattr(up, 'size', 0),
+                        'size': size,
                         'path': path,
-                        'uploaded_on': datetime.now().isoformat(timespec='seconds')
-                    })
-                save_data(st.session_state.data)
-
-            for att in opp.get('attachments', []) or []:
-                aname = att.get('name', '')
-                awhen = att.get('uploaded_on', '')
-                asize = att.get('size', 0)
-                st.markdown(
-                    f"<div class='attachment-row'><div>📎 {aname}</div>"
-                    f"<div class='product-meta'>{awhen} • {asize} bytes</div></div>",
-                    unsafe_allow_html=True
-                )
+                        'uploaded_on': now_iso
+                    }
+
+                # Overlap the disk writes; metadata keeps the upload order
+                with ThreadPoolExecutor(max_workers=8) as ex:
+                    metas = list(ex.map(_persist, new_uploads))
+                opp.setdefault('attachments', []).extend(metas)
+                save_opportunity(opp)
+                persisted.update(getattr(up, 'file_id', getattr(up, 'id', None)) for up in new_uploads)
+
+            attachment_rows = tuple(
+                (str(att.get('name', '')), str(att.get('uploaded_on', '')), str(att.get('size', 0)))
+                for att in opp.get('attachments', []) or []
+            )
+            if attachment_rows:
+                st.markdown(_render_attachments_html(attachment_rows), unsafe_allow_html=True)
             st.markdown('</div>', unsafe_allow_html=True)
 
             # 👉 Navigation to Submit Tender
             def _go_submit():
                 st.session_state['nav_target'] = 'Submit Tender'
-                safe_set_query_params(page='Submit Tender', id=st.session_state.get('current_id'))
+                queue_qp(page='Submit Tender', id=st.session_state.get('current_id'))
                 safe_rerun()
 
             st.button('Go to Submit Tender', type='primary', on_click=_go_submit)
@@ -464,7 +592,7 @@ elif page == 'Submit Tender':
     back_button()
 
     current_id = st.session_state.get('current_id')
-    opp = get_by_id(st.session_state.data, current_id) if current_id else None
+    opp = get_by_id(store, current_id) if current_id else None
     if not opp:
         st.info('Select an opportunity to submit.')
     else:
@@ -473,7 +601,7 @@ elif page == 'Submit Tender':
         st.write('**Account:**', opp.get('account_name', ''))
         st.write('**Expected Revenue:**', money(opp.get('expected_revenue', 0)))
         st.write('**Products:**')
-        st.table(pd.DataFrame(opp.get('products', [])))
+        st.markdown(_products_table_html(_product_rows(opp.get('products'))), unsafe_allow_html=True)
         remarks = st.text_area('Submission Remarks')
         c1, c2 = st.columns([1, 1])
         with c1:
@@ -482,13 +610,16 @@ elif page == 'Submit Tender':
             # Cancel navigates back to Opportunities
             if st.button('Cancel'):
                 st.session_state['nav_target'] = 'Opportunities'
-                safe_set_query_params(page='Opportunities', id=st.session_state.get('current_id'))
+                queue_qp(page='Opportunities', id=st.session_state.get('current_id'))
                 safe_rerun()
         if submit:
             opp['stage'] = 'Submitted'
             opp['last_modified_by'] = 'Tender Desk'
-            save_data(st.session_state.data)
+            save_opportunity(opp)
             st.success('Tender submitted successfully. Stage set to "Submitted".')
             # After submit, keep user on current page but ensure URL reflects it
-            safe_set_query_params(page='Submit Tender', id=st.session_state.get('current_id'))
+            queue_qp(page='Submit Tender', id=st.session_state.get('current_id'))
         st.markdown('</div>', unsafe_allow_html=True)
+
+# ------------------ URL sync ------------------
+flush_qp()
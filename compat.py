@@ -0,0 +1,40 @@
+# Streamlit version compatibility helpers for the Tender Management UI.
+# The app script reruns on every interaction, but this module is imported once
+# per process, so the feature checks below are resolved a single time.
+import inspect
+import streamlit as st
+
+_rerun = getattr(st, "rerun", None) or getattr(st, "experimental_rerun", None) or (lambda: None)
+if 'scope' in inspect.signature(_rerun).parameters:
+    safe_rerun = _rerun
+else:
+    def safe_rerun(scope='app'):
+        # Streamlit without fragment-scoped reruns
+        _rerun()
+
+safe_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+# Always keep URL in sync with current state; a None value removes the key
+# rather than being written as the string "None"
+if hasattr(st, "query_params"):
+    def safe_set_query_params(**kwargs):
+        for k, v in kwargs.items():
+            if v is None:
+                st.query_params.pop(k, None)
+        st.query_params.update({k: v for k, v in kwargs.items() if v is not None})
+
+    def safe_get_query_params():
+        return dict(st.query_params)
+elif hasattr(st, "experimental_set_query_params"):
+    def safe_set_query_params(**kwargs):
+        st.experimental_set_query_params(**{k: v for k, v in kwargs.items() if v is not None})
+
+    def safe_get_query_params():
+        xp = st.experimental_get_query_params()
+        return {k: (v[0] if isinstance(v, list) and v else None) for k, v in xp.items()}
+else:
+    def safe_set_query_params(**kwargs):
+        pass
+
+    def safe_get_query_params():
+        return {}
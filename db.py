@@ -0,0 +1,99 @@
+# SQLite persistence for the Tender Management UI
+import os
+import sqlite3
+import threading
+import orjson
+import streamlit as st
+
+DB_PATH = os.path.join('data', 'tenders.db')
+LEGACY_JSON_PATH = os.path.join('data', 'tenders.json')
+
+# get_conn() hands every session the same connection; all statements and
+# transactions on it are serialised so they cannot interleave across threads
+_conn_lock = threading.RLock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS opportunities (
+    id TEXT PRIMARY KEY,
+    stage TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stage ON opportunities(stage);
+"""
+
+# Fields shown in the Opportunities list; read without decoding the whole payload
+SUMMARY_FIELDS = ('id', 'name', 'account_name', 'stage', 'probability', 'expected_revenue', 'close_date')
+
+def stage_key(stage):
+    """Normalised stage value stored in the indexed `stage` column."""
+    return str(stage or '').strip().lower()
+
+@st.cache_resource
+def get_conn(path=DB_PATH):
+    """Open (once per server process) the SQLite store, creating and migrating it if needed."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Autocommit mode; Streamlit serves sessions from several threads
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    with _conn_lock:
+        conn.executescript(SCHEMA)
+        _migrate_from_json(conn)
+    return conn
+
+def _migrate_from_json(conn):
+    """One-time import of the legacy tenders.json into an empty database."""
+    with _conn_lock:
+        has_rows = conn.execute('SELECT 1 FROM opportunities LIMIT 1').fetchone()
+    if has_rows:
+        return
+    if not os.path.exists(LEGACY_JSON_PATH):
+        return
+    try:
+        with open(LEGACY_JSON_PATH, 'rb') as f:
+            data = orjson.loads(f.read())
+    except Exception:
+        return
+    if not isinstance(data, dict):
+        return
+    upsert_many(conn, [
+        (o['id'], stage_key(o.get('stage')), orjson.dumps(o).decode())
+        for o in data.get('opportunities', []) if o.get('id')
+    ])
+
+def fetch_summaries(conn):
+    cols = ', '.join(f"json_extract(payload, '$.{f}')" for f in SUMMARY_FIELDS)
+    with _conn_lock:
+        rows = conn.execute(f'SELECT {cols} FROM opportunities ORDER BY rowid').fetchall()
+    return [dict(zip(SUMMARY_FIELDS, r)) for r in rows]
+
+def fetch_by_id(conn, opp_id):
+    with _conn_lock:
+        row = conn.execute('SELECT payload FROM opportunities WHERE id = ?', (opp_id,)).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+def insert(conn, row):
+    """Insert a new (id, stage, payload) row; raises sqlite3.IntegrityError if the id exists."""
+    with _conn_lock:
+        conn.execute('INSERT INTO opportunities (id, stage, payload) VALUES (?, ?, ?)', row)
+
+def upsert_many(conn, rows):
+    """Write (id, stage, payload) rows in a single transaction; returns how many rows changed.
+
+    Rows whose stored payload is identical are left untouched.
+    """
+    if not rows:
+        return 0
+    with _conn_lock:
+        before = conn.total_changes
+        conn.execute('BEGIN')
+        try:
+            conn.executemany(
+                'INSERT INTO opportunities (id, stage, payload) VALUES (?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET stage = excluded.stage, payload = excluded.payload '
+                'WHERE payload IS NOT excluded.payload',
+                rows
+            )
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return conn.total_changes - before